@@ -1,60 +1,285 @@
 import re
 import google.generativeai as genai
+from google.generativeai import caching
+from google.generativeai import client as genai_client
+from google.api_core import exceptions as google_exceptions
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 import os
+import time
+import asyncio
+import hashlib
+import datetime
+from collections import OrderedDict
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import List, Dict, Optional, Callable, Tuple, AsyncIterator
+import models
 
 load_dotenv()
 
 # Configure Gemini AI
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+# Shared model instance so the underlying client/channel is reused across calls
+PRO_MODEL = genai.GenerativeModel('gemini-pro')
+
+# Splits raw quiz text into one block per question
+_QUESTION_SPLIT_RE = re.compile(r'\n(?=Q:|\d+\.)')
+# Last whitespace character before the search's endpos, and the next one after a position
+_LAST_SPACE_RE = re.compile(r'\s(?=\S*\Z)')
+_SPACE_RE = re.compile(r'\s')
+
+# How long startup waits for the Gemini connection before giving up on warming it
+GEMINI_WARMUP_TIMEOUT = 10
+
+# Process-wide cap on in-flight Gemini calls; each call frees its slot as soon as it finishes
+GEMINI_SEM = asyncio.Semaphore(int(os.getenv("GEMINI_MAX_CONCURRENCY", "16")))
+
+# Rate-limit/overload errors worth retrying with backoff
+RETRYABLE_GEMINI_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable)
+
+# Max concurrent Gemini calls when summarizing a long text chunk by chunk
+SUMMARY_CHUNK_CONCURRENCY = 8
+
+# In-process LRU of recent AI responses, backed by the response_cache table.
+# Entries hold (value, expiry on the time.monotonic() clock) and share the table's TTL.
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+_response_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+# Gemini context caches for large, repeatedly used documents (e.g. chat notes)
+CONTEXT_CACHE_TTL = datetime.timedelta(hours=1)
+CONTEXT_CACHE_MIN_CHARS = int(os.getenv("CONTEXT_CACHE_MIN_CHARS", "8000"))  # Gemini rejects tiny caches
+# Contexts that failed to cache are sent inline without retrying the create for this long
+CONTEXT_CACHE_FAILURE_TTL = 600
+# key -> (model, or None if caching failed; expiry on the time.monotonic() clock)
+_context_models: Dict[str, Tuple[Optional[genai.GenerativeModel], float]] = {}
+# key -> in-flight create, shared by concurrent requests for the same context
+_context_creates: Dict[str, "asyncio.Task[Optional[genai.GenerativeModel]]"] = {}
+
+async def warm_up_gemini() -> None:
+    """
+    Open the shared Gemini gRPC channel before the first request needs it.
+    All models share one HTTP/2 channel that multiplexes concurrent calls,
+    so this moves the one-off DNS/TCP/TLS setup out of the request path.
+    """
+    try:
+        channel = genai_client.get_default_generative_async_client().transport.grpc_channel
+        await asyncio.wait_for(channel.channel_ready(), timeout=GEMINI_WARMUP_TIMEOUT)
+    except Exception as e:
+        print(f"Gemini connection warm-up skipped: {e!r}")
+
+def hash_text(text: str) -> str:
+    """
+    Short, stable hash of a piece of text
+    """
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+def make_cache_key(namespace: str, model_name: str, prompt: str) -> str:
+    """
+    Build a cache key from the endpoint, model and a hash of the prompt
+    """
+    return f"{namespace}:{model_name}:{hash_text(prompt)}"
+
+async def get_cached_response(key: str) -> Optional[str]:
+    """
+    Look up a cached response in memory first, then in the database
+    """
+    entry = _response_cache.get(key)
+    if entry is not None:
+        value, expires_at = entry
+        if expires_at > time.monotonic():
+            _response_cache.move_to_end(key)
+            return value
+        del _response_cache[key]
+    
+    row = await models.get_cached_response(key)
+    if row is None:
+        return None
+    value, ttl_left = row
+    _remember_response(key, value, ttl_left)
+    return value
+
+async def cache_response(key: str, value: str) -> None:
+    """
+    Store a response in memory and persist it to the database
+    """
+    _remember_response(key, value, models.RESPONSE_CACHE_TTL)
+    await models.save_cached_response(key, value)
+
+def _remember_response(key: str, value: str, ttl: float) -> None:
+    _response_cache[key] = (value, time.monotonic() + ttl)
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+async def call_gemini(model: genai.GenerativeModel, prompt: str, **kwargs):
+    """
+    Call Gemini, retrying with jittered exponential backoff when rate limited.
+    Callers hold GEMINI_SEM around this.
+    """
+    async for attempt in AsyncRetrying(
+        retry=retry_if_exception_type(RETRYABLE_GEMINI_ERRORS),
+        stop=stop_after_attempt(3),
+        wait=wait_exponential_jitter(initial=0.5, max=8),
+        reraise=True,
+    ):
+        with attempt:
+            return await model.generate_content_async(prompt, **kwargs)
+
+async def generate_text(model: genai.GenerativeModel, prompt: str, namespace: str,
+                        use_cache: bool = True,
+                        cache_if: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    Generate text with Gemini, reusing a cached answer for an identical prompt
+    """
+    key = make_cache_key(namespace, model.model_name, prompt)
+    if use_cache:
+        cached = await get_cached_response(key)
+        if cached is not None:
+            return cached
+    
+    async with GEMINI_SEM:
+        response = await call_gemini(model, prompt)
+    text = response.text
+    if cache_if is None or cache_if(text):
+        await cache_response(key, text)
+    return text
+
+async def stream_text(model: genai.GenerativeModel, prompt: str, namespace: str,
+                      use_cache: bool = True,
+                      cache_if: Optional[Callable[[str], bool]] = None) -> AsyncIterator[str]:
+    """
+    Stream text from Gemini chunk by chunk, caching the full answer once complete
+    """
+    key = make_cache_key(namespace, model.model_name, prompt)
+    if use_cache:
+        cached = await get_cached_response(key)
+        if cached is not None:
+            yield cached
+            return
+    
+    parts = []
+    # The slot is held until the stream is fully consumed (or abandoned)
+    async with GEMINI_SEM:
+        response = await call_gemini(model, prompt, stream=True)
+        async for chunk in response:
+            parts.append(chunk.text)
+            yield chunk.text
+    
+    text = "".join(parts)
+    if cache_if is None or cache_if(text):
+        await cache_response(key, text)
+
+async def get_context_model(model_name: str, context: str, system_instruction: str) -> Optional[genai.GenerativeModel]:
+    """
+    Get a model bound to a Gemini context cache holding `context`,
+    creating the cache on first use. Returns None if the context can't be cached.
+    """
+    if len(context) < CONTEXT_CACHE_MIN_CHARS:
+        return None
+    
+    key = hash_text(f"{model_name}\n{system_instruction}\n{context}")
+    entry = _context_models.get(key)
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+    
+    # Concurrent requests for the same context wait on a single create call
+    task = _context_creates.get(key)
+    if task is None:
+        task = asyncio.create_task(_create_context_model(key, model_name, context, system_instruction))
+        _context_creates[key] = task
+        task.add_done_callback(lambda _: _context_creates.pop(key, None))
+    # Shielded so one caller giving up doesn't cancel the create for the others
+    return await asyncio.shield(task)
+
+async def _create_context_model(key: str, model_name: str, context: str,
+                                system_instruction: str) -> Optional[genai.GenerativeModel]:
+    """
+    Create the Gemini context cache behind get_context_model and remember the
+    outcome, including failures, so later requests don't repeat the round-trip
+    """
+    try:
+        cached_content = await asyncio.to_thread(
+            caching.CachedContent.create,
+            model=model_name,
+            system_instruction=system_instruction,
+            contents=[context],
+            ttl=CONTEXT_CACHE_TTL,
+        )
+    except Exception as e:
+        print(f"Context caching unavailable, sending context inline: {e}")
+        model = None
+        lifetime = CONTEXT_CACHE_FAILURE_TTL
+    else:
+        model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+        lifetime = CONTEXT_CACHE_TTL.total_seconds() - 60  # Expire a minute early to be safe
+    
+    # Drop expired entries, then remember this outcome
+    now = time.monotonic()
+    for stale_key in [k for k, (_, expires_at) in _context_models.items() if expires_at <= now]:
+        del _context_models[stale_key]
+    _context_models[key] = (model, now + lifetime)
+    return model
+
 def chunk_text(text: str, max_length: int = 4000) -> List[str]:
     """
-    Split long text into smaller chunks for processing
+    Split long text into smaller chunks for processing.
+    Chunks are cut at the last whitespace that fits, slicing the original
+    string; only each emitted chunk has its whitespace collapsed to single spaces.
     """
-    words = text.split()
     chunks = []
-    current_chunk = []
-    current_length = 0
-    
-    for word in words:
-        word_length = len(word) + 1  # +1 for space
-        if current_length + word_length > max_length:
-            chunks.append(' '.join(current_chunk))
-            current_chunk = [word]
-            current_length = word_length
-        else:
-            current_chunk.append(word)
-            current_length += word_length
+    start = 0
+    end = len(text)
     
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
+    while start < end:
+        # Skip whitespace between chunks
+        while start < end and text[start].isspace():
+            start += 1
+        if start >= end:
+            break
+        
+        if end - start < max_length:
+            chunks.append(' '.join(text[start:end].split()))
+            break
+        
+        match = _LAST_SPACE_RE.search(text, start, start + max_length)
+        if match:
+            split = match.start()
+        else:
+            # A single word longer than max_length gets a chunk of its own
+            match = _SPACE_RE.search(text, start)
+            split = match.start() if match else end
+        
+        chunks.append(' '.join(text[start:split].split()))
+        start = split + 1
     
     return chunks
 
-def generate_summary(text: str, summary_type: str = "concise") -> str:
+async def generate_summary(text: str, summary_type: str = "concise", use_cache: bool = True) -> str:
     """
-    Generate summary using Gemini AI with different styles
+    Generate summary using Gemini AI with different styles.
+    Pass use_cache=False to ignore cached answers and generate a fresh summary.
     """
     try:
-        model = genai.GenerativeModel('gemini-pro')
-        
         # Handle long texts by chunking
         if len(text) > 4000:
             chunks = chunk_text(text, 4000)
-            summaries = []
             
-            for chunk in chunks:
-                prompt = f"Summarize this text concisely:\n\n{chunk}"
-                response = model.generate_content(prompt)
-                summaries.append(response.text)
+            # Summarize chunks concurrently; the semaphore frees a slot as soon as
+            # any call finishes, so at most SUMMARY_CHUNK_CONCURRENCY are in flight
+            # (on top of the process-wide GEMINI_SEM limit in generate_text)
+            semaphore = asyncio.Semaphore(SUMMARY_CHUNK_CONCURRENCY)
+            
+            async def summarize_chunk(chunk: str) -> str:
+                async with semaphore:
+                    prompt = f"Summarize this text concisely:\n\n{chunk}"
+                    return await generate_text(PRO_MODEL, prompt, "summary", use_cache=use_cache)
+            
+            summaries = await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks))
             
             # Combine chunk summaries
             combined = " ".join(summaries)
             final_prompt = f"Create a final {summary_type} summary from these summaries:\n\n{combined}"
-            final_response = model.generate_content(final_prompt)
-            return final_response.text
+            return await generate_text(PRO_MODEL, final_prompt, "summary", use_cache=use_cache)
         
         # For shorter texts, direct summarization
         prompts = {
@@ -64,19 +289,18 @@ def generate_summary(text: str, summary_type: str = "concise") -> str:
         }
         
         prompt = prompts.get(summary_type, prompts["concise"])
-        response = model.generate_content(prompt)
-        return response.text
+        return await generate_text(PRO_MODEL, prompt, "summary", use_cache=use_cache)
     
     except Exception as e:
         raise Exception(f"Summary generation failed: {str(e)}")
 
-def generate_quiz(text: str, num_questions: int = 5, question_type: str = "mixed") -> str:
+async def generate_quiz(text: str, num_questions: int = 5, question_type: str = "mixed",
+                        use_cache: bool = True) -> str:
     """
-    Generate quiz questions using Gemini AI
+    Generate quiz questions using Gemini AI.
+    Pass use_cache=False to ignore cached answers and generate a fresh quiz.
     """
     try:
-        model = genai.GenerativeModel('gemini-pro')
-        
         if question_type == "mcq":
             prompt = f"""Generate exactly {num_questions} multiple-choice questions from this text.
 
@@ -122,8 +346,11 @@ Correct: [True/False]
 Text to generate questions from:
 {text}"""
         
-        response = model.generate_content(prompt)
-        return response.text
+        # Only cache generations that parse into a usable quiz
+        return await generate_text(
+            PRO_MODEL, prompt, "quiz", use_cache=use_cache,
+            cache_if=quiz_cache_check(num_questions, question_type)
+        )
     
     except Exception as e:
         raise Exception(f"Quiz generation failed: {str(e)}")
@@ -135,62 +362,97 @@ def parse_quiz_response(quiz_text: str, question_type: str) -> List[Dict]:
     questions = []
     
     # Split by question markers
-    question_blocks = re.split(r'\n(?=Q:|\d+\.)', quiz_text.strip())
+    question_blocks = _QUESTION_SPLIT_RE.split(quiz_text.strip())
     
     for block in question_blocks:
-        if not block.strip() or 'Q:' not in block:
+        if 'Q:' not in block:
             continue
         
-        try:
-            # Extract question
-            question_match = re.search(r'Q:\s*(.+?)(?=\n[A-D]\)|Correct:|$)', block, re.DOTALL)
-            if not question_match:
+        # Single pass over the block's lines: "Q:" starts the question, "A)".."D)"
+        # start an option, a line starting with "Correct:" holds the answer, anything
+        # else continues whichever part is currently open
+        question_parts = None
+        options = {}
+        current = None
+        answer = None
+        awaiting_answer = False
+        
+        for line in block.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            
+            if awaiting_answer:
+                answer = line
+                awaiting_answer = False
                 continue
             
-            question_text = question_match.group(1).strip()
+            # "Correct:" only counts as the answer marker at the start of a line, so
+            # questions like "Which statement is correct: ..." are left intact
+            if question_parts is not None and line[:8].lower() == 'correct:':
+                if answer is None:
+                    answer = line[8:].strip()
+                    awaiting_answer = not answer
+                current = None
+                continue
             
-            # Check if it's MCQ or True/False
-            if re.search(r'[A-D]\)', block):
-                # Multiple choice question
-                options = []
-                for letter in ['A', 'B', 'C', 'D']:
-                    option_match = re.search(f'{letter}\)\s*(.+?)(?=\n[A-D]\)|Correct:|$)', block, re.DOTALL)
-                    if option_match:
-                        options.append(option_match.group(1).strip())
-                
-                # Extract correct answer
-                correct_match = re.search(r'Correct:\s*([A-D])', block, re.IGNORECASE)
-                if correct_match and len(options) == 4:
-                    correct_letter = correct_match.group(1).upper()
-                    letter_to_index = {'A': 0, 'B': 1, 'C': 2, 'D': 3}
-                    correct_answer = options[letter_to_index[correct_letter]]
-                    
-                    questions.append({
-                        "question": question_text,
-                        "options": options,
-                        "correct_answer": correct_answer,
-                        "type": "mcq"
-                    })
+            if question_parts is None:
+                marker = line.find('Q:')
+                if marker == -1:
+                    continue
+                question_parts = []
+                current = question_parts
+                line = line[marker + 2:]
+            elif len(line) >= 2 and line[1] == ')' and line[0] in 'ABCD':
+                letter = line[0]
+                current = None if letter in options else options.setdefault(letter, [])
+                line = line[2:]
             
-            else:
-                # True/False question
-                correct_match = re.search(r'Correct:\s*(True|False)', block, re.IGNORECASE)
-                if correct_match:
-                    correct_answer = correct_match.group(1).capitalize()
-                    
-                    questions.append({
-                        "question": question_text,
-                        "options": None,
-                        "correct_answer": correct_answer,
-                        "type": "true_false"
-                    })
+            line = line.strip()
+            if current is not None and line:
+                current.append(line)
         
-        except Exception as e:
-            # Skip malformed questions
+        if not question_parts or not answer:
             continue
+        question_text = "\n".join(question_parts)
+        
+        # Check if it's MCQ or True/False
+        if options:
+            # Multiple choice question
+            correct_letter = answer[0].upper()
+            if len(options) == 4 and correct_letter in options:
+                option_texts = ["\n".join(options[letter]) for letter in 'ABCD']
+                questions.append({
+                    "question": question_text,
+                    "options": option_texts,
+                    "correct_answer": option_texts['ABCD'.index(correct_letter)],
+                    "type": "mcq"
+                })
+        
+        else:
+            # True/False question
+            lowered = answer.lower()
+            if lowered.startswith('true') or lowered.startswith('false'):
+                questions.append({
+                    "question": question_text,
+                    "options": None,
+                    "correct_answer": "True" if lowered.startswith('true') else "False",
+                    "type": "true_false"
+                })
     
     return questions
 
+def quiz_cache_check(num_questions: Optional[int], question_type: str) -> Callable[[str], bool]:
+    """
+    cache_if for quiz generations: only keep output that parses into a quiz
+    with enough valid questions, so a degenerate answer is never pinned in the cache
+    """
+    if num_questions is None:  # QuizRequest allows an explicit null; use its default
+        num_questions = 5
+    min_questions = max(1, num_questions - 2)
+    return lambda quiz_text: validate_quiz_questions(
+        parse_quiz_response(quiz_text, question_type), min_questions=min_questions)
+
 def validate_quiz_questions(questions: List[Dict], min_questions: int = 3) -> bool:
     """
     Validate that generated quiz has minimum quality
@@ -208,16 +470,36 @@ def validate_quiz_questions(questions: List[Dict], min_questions: int = 3) -> bo
     
     return True
 
-def regenerate_if_needed(text: str, num_questions: int, question_type: str, max_attempts: int = 2) -> List[Dict]:
+async def regenerate_if_needed(text: str, num_questions: int, question_type: str, max_attempts: int = 2) -> List[Dict]:
     """
-    Try to generate valid quiz, retry if needed
+    Try to generate valid quiz, running the attempts concurrently and
+    keeping the first one that validates
     """
-    for attempt in range(max_attempts):
-        quiz_text = generate_quiz(text, num_questions, question_type)
-        questions = parse_quiz_response(quiz_text, question_type)
-        
-        if validate_quiz_questions(questions, min_questions=max(1, num_questions - 2)):
-            return questions
+    tasks = [
+        asyncio.create_task(generate_quiz(text, num_questions, question_type))
+        for _ in range(max_attempts)
+    ]
+    questions = []
+    error = None
+    
+    try:
+        for next_attempt in asyncio.as_completed(tasks):
+            try:
+                quiz_text = await next_attempt
+            except Exception as e:
+                error = e
+                continue
+            
+            questions = parse_quiz_response(quiz_text, question_type)
+            if validate_quiz_questions(questions, min_questions=max(1, num_questions - 2)):
+                return questions
+    finally:
+        # Stop any attempts still in flight once we have an answer
+        for task in tasks:
+            task.cancel()
+    
+    if not questions and error is not None:
+        raise error
     
     # Return whatever we got on last attempt
     return questions
\ No newline at end of file
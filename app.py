@@ -1,16 +1,29 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import os
+import io
+import orjson
+import asyncio
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import google.generativeai as genai
-from typing import List, Optional
-import shutil
+from typing import List, Optional, AsyncIterator
+from ai_services import (
+    generate_text, stream_text, get_context_model, hash_text, warm_up_gemini, parse_quiz_response,
+    quiz_cache_check, make_cache_key, get_cached_response
+)
+from models import init_database, quiz_result_writer
+from utils import extract_text_from_file
 
 # Data structure for the chat request
 class ChatRequest(BaseModel):
     question: str
     context: str  # The text from the uploaded PDF/Doc
+    stream: Optional[bool] = False  # Stream the answer as server-sent events
+    regenerate: Optional[bool] = False  # Skip cached answers and ask Gemini again
 
 # Load environment variables
 load_dotenv()
@@ -18,8 +31,28 @@ load_dotenv()
 # Configure Gemini AI
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+# Shared model instance so the underlying client/channel is reused across requests
+FLASH_MODEL = genai.GenerativeModel('gemini-2.5-flash')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect to Gemini in the background so startup isn't held up by the network
+    app.state.gemini_warmup = asyncio.create_task(warm_up_gemini())
+    # Batch quiz result writes in the background
+    quiz_results_stop = asyncio.Event()
+    quiz_results_task = asyncio.create_task(quiz_result_writer(quiz_results_stop))
+    yield
+    # Let the writer drain the queue rather than cancelling it mid-write
+    quiz_results_stop.set()
+    await quiz_results_task
+
 # Initialize FastAPI app
-app = FastAPI(title="AI Study Buddy API", version="1.0.0")
+app = FastAPI(
+    title="AI Study Buddy API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,  # Faster JSON encoding than the stdlib
+)
 
 # CORS middleware for frontend communication
 app.add_middleware(
@@ -30,19 +63,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create uploads directory if it doesn't exist
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Make sure the database (including the response cache) is ready
+init_database()
 
 # Pydantic models for request/response
 class SummaryRequest(BaseModel):
     text: str
     summary_type: Optional[str] = "concise"  # concise, detailed, bullet_points
+    stream: Optional[bool] = False  # Stream the summary as server-sent events
+    regenerate: Optional[bool] = False  # Skip cached answers and ask Gemini again
 
 class QuizRequest(BaseModel):
     text: str
     num_questions: Optional[int] = 5
     question_type: Optional[str] = "mixed"  # mcq, true_false, mixed
+    stream: Optional[bool] = False  # Stream the raw quiz text, then the parsed questions
+    regenerate: Optional[bool] = False  # Skip cached answers and ask Gemini again
 
 class QuizQuestion(BaseModel):
     question: str
@@ -53,6 +89,50 @@ class QuizQuestion(BaseModel):
 class QuizResponse(BaseModel):
     questions: List[QuizQuestion]
 
+def sse_response(events: AsyncIterator[dict]) -> StreamingResponse:
+    """
+    Send each event as a server-sent event as soon as it is produced
+    """
+    async def event_stream():
+        try:
+            async for event in events:
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
+                # Give the event loop a chance to flush and serve other requests
+                await asyncio.sleep(0)
+        except Exception as e:
+            # Headers are already sent, so report failures in-band
+            yield b"data: " + orjson.dumps({'error': str(e)}) + b"\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+def response_etag(prompt: str, body: str) -> str:
+    """
+    Strong ETag for a generated response, naming both the prompt and the exact body
+    """
+    return f'"{hash_text(FLASH_MODEL.model_name + chr(0) + prompt + chr(0) + body)}"'
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """
+    Check an If-None-Match header (which may list several tags) against our ETag
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags or "*" in tags
+
+async def cached_etag_match(namespace: str, prompt: str, if_none_match: Optional[str]) -> Optional[str]:
+    """
+    Return the ETag of the cached response for this prompt if If-None-Match names it
+    (or is *), else None. Only a body still in the response cache can be matched.
+    """
+    if not if_none_match:
+        return None
+    cached = await get_cached_response(make_cache_key(namespace, FLASH_MODEL.model_name, prompt))
+    if cached is None:
+        return None
+    etag = response_etag(prompt, cached)
+    return etag if etag_matches(etag, if_none_match) else None
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -88,17 +168,11 @@ async def upload_file(file: UploadFile = File(...)):
                 detail=f"File type not supported. Allowed: {', '.join(allowed_extensions)}"
             )
         
-        # Save file temporarily
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Extract text based on file type
-        from utils import extract_text_from_file
-        text_content = extract_text_from_file(file_path)
+        # Read the upload into memory; no temporary file on disk
+        data = await file.read()
         
-        # Clean up the file
-        os.remove(file_path)
+        # Extract text based on file type (CPU-bound, so keep it off the event loop)
+        text_content = await run_in_threadpool(extract_text_from_file, io.BytesIO(data), file.filename)
         
         return {
             "success": True,
@@ -112,13 +186,11 @@ async def upload_file(file: UploadFile = File(...)):
 
 # Summarization endpoint
 @app.post("/api/summarize")
-async def summarize_text(request: SummaryRequest):
+async def summarize_text(request: SummaryRequest, response: Response, if_none_match: Optional[str] = Header(None)):
     """
     Generate AI summary using Gemini AI
     """
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
         # Create prompt based on summary type
         if request.summary_type == "concise":
             prompt = f"Provide a concise summary of the following text in 3-5 sentences:\n\n{request.text}"
@@ -129,9 +201,30 @@ async def summarize_text(request: SummaryRequest):
         else:
             prompt = f"Summarize the following text:\n\n{request.text}"
         
-        # Generate summary
-        response = model.generate_content(prompt)
-        summary = response.text
+        if request.stream:
+            async def summary_events():
+                summary_length = 0
+                async for chunk in stream_text(FLASH_MODEL, prompt, "summary", use_cache=not request.regenerate):
+                    summary_length += len(chunk)
+                    yield {"text": chunk}
+                yield {
+                    "success": True,
+                    "original_length": len(request.text),
+                    "summary_length": summary_length,
+                    "summary_type": request.summary_type
+                }
+            
+            return sse_response(summary_events())
+        
+        # The client already has this summary; skip Gemini and the body
+        if not request.regenerate:
+            etag = await cached_etag_match("summary", prompt, if_none_match)
+            if etag:
+                return Response(status_code=304, headers={"ETag": etag})
+        
+        # Generate summary (every summary is cached, so the ETag names a stored body)
+        summary = await generate_text(FLASH_MODEL, prompt, "summary", use_cache=not request.regenerate)
+        response.headers["ETag"] = response_etag(prompt, summary)
         
         return {
             "success": True,
@@ -147,13 +240,11 @@ async def summarize_text(request: SummaryRequest):
 
 # Quiz generation endpoint
 @app.post("/api/generate-quiz", response_model=QuizResponse)
-async def generate_quiz(request: QuizRequest):
+async def generate_quiz(request: QuizRequest, response: Response, if_none_match: Optional[str] = Header(None)):
     """
     Generate quiz questions using Gemini AI
     """
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
         # Create prompt for quiz generation
         if request.question_type == "mcq":
             prompt = f"""Generate {request.num_questions} multiple-choice questions based on the following text.
@@ -203,12 +294,35 @@ Correct: [True/False]
 Text:
 {request.text}"""
         
+        # Only cache output that parses into a usable quiz
+        cache_if = quiz_cache_check(request.num_questions, request.question_type)
+        
+        if request.stream:
+            async def quiz_events():
+                parts = []
+                async for chunk in stream_text(FLASH_MODEL, prompt, "quiz",
+                                             use_cache=not request.regenerate, cache_if=cache_if):
+                    parts.append(chunk)
+                    yield {"text": chunk}
+                questions = parse_quiz_response("".join(parts), request.question_type)
+                yield QuizResponse(questions=questions).model_dump()
+            
+            return sse_response(quiz_events())
+        
+        # The client already has this quiz; skip Gemini and the body
+        if not request.regenerate:
+            etag = await cached_etag_match("quiz", prompt, if_none_match)
+            if etag:
+                return Response(status_code=304, headers={"ETag": etag})
+        
         # Generate quiz
-        response = model.generate_content(prompt)
-        quiz_text = response.text
+        quiz_text = await generate_text(FLASH_MODEL, prompt, "quiz",
+                                        use_cache=not request.regenerate, cache_if=cache_if)
+        # Output that failed cache_if wasn't cached, so a retry may differ: no ETag for it
+        if cache_if(quiz_text):
+            response.headers["ETag"] = response_etag(prompt, quiz_text)
         
         # Parse the quiz response (simplified parsing)
-        from ai_services import parse_quiz_response
         questions = parse_quiz_response(quiz_text, request.question_type)
         
         return QuizResponse(questions=questions)
@@ -231,13 +345,33 @@ async def get_progress(user_id: str):
         "message": "Progress tracking coming soon!"
     }
 
+# Tutor prompt pieces, shared by the inline and context-cached chat paths
+CHAT_ROLE = "You are an intelligent AI Study Buddy. Your goal is to help the student learn."
+CHAT_INSTRUCTIONS = """Instructions:
+        1. PRIORITIZE the Context above. Answer based on the notes whenever possible.
+        2. If the student asks a general question (like "what else is important?" or "give me examples") that isn't in the notes, USE YOUR GENERAL KNOWLEDGE to help them.
+        3. If you use general knowledge, start your answer with: "This isn't explicitly in your notes, but..."
+        4. Be encouraging and concise."""
+
 #chat endpoint
 @app.post("/api/chat")
 async def chat_with_document(request: ChatRequest):
     try:
-        # We tell Gemini to act like a tutor using ONLY the provided text
-        prompt = f"""
-        You are an intelligent AI Study Buddy. Your goal is to help the student learn.
+        # Long notes are stored once in a Gemini context cache and reused for every question
+        context_model = await get_context_model(
+            FLASH_MODEL.model_name,
+            f"Context from the student's notes:\n{request.context}",
+            f"{CHAT_ROLE}\n\n{CHAT_INSTRUCTIONS}"
+        )
+        if context_model is not None:
+            model = context_model
+            prompt = f"Student's Question: \n{request.question}"
+            namespace = f"chat:{hash_text(request.context)}"
+        else:
+            # We tell Gemini to act like a tutor using ONLY the provided text
+            model = FLASH_MODEL
+            prompt = f"""
+        {CHAT_ROLE}
         
         Context from the student's notes:
         {request.context}
@@ -245,17 +379,18 @@ async def chat_with_document(request: ChatRequest):
         Student's Question: 
         {request.question}
         
-        Instructions:
-        1. PRIORITIZE the Context above. Answer based on the notes whenever possible.
-        2. If the student asks a general question (like "what else is important?" or "give me examples") that isn't in the notes, USE YOUR GENERAL KNOWLEDGE to help them.
-        3. If you use general knowledge, start your answer with: "This isn't explicitly in your notes, but..."
-        4. Be encouraging and concise.
+        {CHAT_INSTRUCTIONS}
         """
+            namespace = "chat"
+        
+        if request.stream:
+            return sse_response(
+                {"text": chunk} async for chunk in stream_text(model, prompt, namespace, use_cache=not request.regenerate)
+            )
         
-        model = genai.GenerativeModel('gemini-2.5-flash')# Or 'gemini-pro'
-        response = model.generate_content(prompt)
+        answer = await generate_text(model, prompt, namespace, use_cache=not request.regenerate)
         
-        return {"answer": response.text}
+        return {"answer": answer}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,7 +1,12 @@
 import sqlite3
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
-import json
+from typing import List, Dict, Optional, Tuple
+import orjson
+import zstandard
 import os
 from dotenv import load_dotenv
 
@@ -9,12 +14,57 @@ load_dotenv()
 
 DATABASE_NAME = os.getenv("DATABASE_NAME", "study_buddy.db")
 
+# Cached AI responses expire after this many seconds; the table is also capped at
+# RESPONSE_CACHE_MAX_ROWS, pruned every RESPONSE_CACHE_PRUNE_EVERY writes
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_ROWS = int(os.getenv("RESPONSE_CACHE_MAX_ROWS", "10000"))
+RESPONSE_CACHE_PRUNE_EVERY = 100
+_response_cache_writes = 0
+
+# One connection per thread, reused across calls instead of reopening the file each time
+_local = threading.local()
+
+# Dedicated threads for blocking sqlite3 work so it never runs on the event loop
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("DB_MAX_WORKERS", "4")), thread_name_prefix="db")
+
+def run_in_db_thread(func):
+    """Turn a blocking database function into a coroutine that runs on DB_EXECUTOR"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(DB_EXECUTOR, functools.partial(func, *args, **kwargs))
+    return wrapper
+
 def get_db_connection():
-    """Create and return a database connection"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+    """Return this thread's database connection, opening and tuning it on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_NAME)
+        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        conn.execute('PRAGMA journal_mode=WAL')  # Readers don't block the writer
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA cache_size=-65536')
+        _local.conn = conn
     return conn
 
+def _enc(text: str) -> bytes:
+    """Compress text for storage in a BLOB column"""
+    compressor = getattr(_local, "compressor", None)
+    if compressor is None:
+        compressor = _local.compressor = zstandard.ZstdCompressor(level=3)
+    return compressor.compress(text.encode('utf-8'))
+
+def _dec(value) -> str:
+    """Decompress a value written by _enc; rows stored before compression are plain text"""
+    if isinstance(value, str):
+        return value
+    decompressor = getattr(_local, "decompressor", None)
+    if decompressor is None:
+        decompressor = _local.decompressor = zstandard.ZstdDecompressor()
+    return decompressor.decompress(value).decode('utf-8')
+
 def init_database():
     """Initialize database tables"""
     conn = get_db_connection()
@@ -36,7 +86,7 @@ def init_database():
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id TEXT NOT NULL,
         filename TEXT NOT NULL,
-        original_text TEXT NOT NULL,
+        original_text BLOB NOT NULL,  -- zstd-compressed, see _enc/_dec
         text_length INTEGER,
         uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (user_id) REFERENCES users(user_id)
@@ -49,7 +99,7 @@ def init_database():
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         note_id INTEGER NOT NULL,
         user_id TEXT NOT NULL,
-        summary_text TEXT NOT NULL,
+        summary_text BLOB NOT NULL,  -- zstd-compressed, see _enc/_dec
         summary_type TEXT DEFAULT 'concise',
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (note_id) REFERENCES notes(id),
@@ -87,64 +137,148 @@ def init_database():
     )
     ''')
     
+    # Indexes for the per-user and per-note lookups
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_user ON notes(user_id, uploaded_at DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_summaries_note ON summaries(note_id, created_at DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_quizzes_user ON quizzes(user_id, created_at DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_quiz_results_user ON quiz_results(user_id)')
+    
+    # Per-user progress counters, kept current by the triggers below
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_stats'")
+    user_stats_exists = cursor.fetchone() is not None
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id TEXT PRIMARY KEY,
+        total_notes INTEGER NOT NULL DEFAULT 0,
+        total_quizzes INTEGER NOT NULL DEFAULT 0,
+        total_attempts INTEGER NOT NULL DEFAULT 0,
+        score_sum REAL NOT NULL DEFAULT 0,
+        last_activity TIMESTAMP
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_user_stats_notes AFTER INSERT ON notes
+    BEGIN
+        INSERT INTO user_stats (user_id, total_notes, last_activity)
+        VALUES (NEW.user_id, 1, NEW.uploaded_at)
+        ON CONFLICT(user_id) DO UPDATE SET
+            total_notes = total_notes + 1,
+            last_activity = MAX(COALESCE(last_activity, excluded.last_activity), excluded.last_activity);
+    END
+    ''')
+    
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_user_stats_quizzes AFTER INSERT ON quizzes
+    BEGIN
+        INSERT INTO user_stats (user_id, total_quizzes)
+        VALUES (NEW.user_id, 1)
+        ON CONFLICT(user_id) DO UPDATE SET total_quizzes = total_quizzes + 1;
+    END
+    ''')
+    
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_user_stats_quiz_results AFTER INSERT ON quiz_results
+    BEGIN
+        INSERT INTO user_stats (user_id, total_attempts, score_sum)
+        VALUES (NEW.user_id, 1, COALESCE(NEW.percentage, 0))
+        ON CONFLICT(user_id) DO UPDATE SET
+            total_attempts = total_attempts + 1,
+            score_sum = score_sum + excluded.score_sum;
+    END
+    ''')
+    
+    # Backfill counters for data written before user_stats existed
+    if not user_stats_exists:
+        cursor.execute('''
+        INSERT INTO user_stats (user_id, total_notes, total_quizzes, total_attempts, score_sum, last_activity)
+        SELECT
+            u.user_id,
+            (SELECT COUNT(*) FROM notes WHERE user_id = u.user_id),
+            (SELECT COUNT(*) FROM quizzes WHERE user_id = u.user_id),
+            (SELECT COUNT(*) FROM quiz_results WHERE user_id = u.user_id),
+            (SELECT COALESCE(SUM(percentage), 0) FROM quiz_results WHERE user_id = u.user_id),
+            (SELECT MAX(uploaded_at) FROM notes WHERE user_id = u.user_id)
+        FROM (
+            SELECT user_id FROM notes
+            UNION SELECT user_id FROM quizzes
+            UNION SELECT user_id FROM quiz_results
+        ) u
+        ''')
+    
+    # AI response cache table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS response_cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_created ON response_cache(created_at)')
+    
     conn.commit()
-    conn.close()
+    _prune_response_cache(conn)
     print(f"✅ Database initialized: {DATABASE_NAME}")
 
 # User operations
+@run_in_db_thread
 def create_user(user_id: str) -> bool:
     """Create a new user or update last active time"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-        INSERT INTO users (user_id, last_active) 
-        VALUES (?, CURRENT_TIMESTAMP)
-        ON CONFLICT(user_id) DO UPDATE SET last_active = CURRENT_TIMESTAMP
-        ''', (user_id,))
-        conn.commit()
-        conn.close()
+        with conn:  # Commits on success, rolls back on error
+            cursor = conn.cursor()
+            cursor.execute('''
+            INSERT INTO users (user_id, last_active) 
+            VALUES (?, CURRENT_TIMESTAMP)
+            ON CONFLICT(user_id) DO UPDATE SET last_active = CURRENT_TIMESTAMP
+            ''', (user_id,))
         return True
     except Exception as e:
         print(f"Error creating user: {e}")
         return False
 
+@run_in_db_thread
 def get_user(user_id: str) -> Optional[Dict]:
     """Get user information"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
     user = cursor.fetchone()
-    conn.close()
     return dict(user) if user else None
 
 # Note operations
+@run_in_db_thread
 def save_note(user_id: str, filename: str, text_content: str) -> Optional[int]:
     """Save uploaded note to database"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-        INSERT INTO notes (user_id, filename, original_text, text_length)
-        VALUES (?, ?, ?, ?)
-        ''', (user_id, filename, text_content, len(text_content)))
-        note_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            INSERT INTO notes (user_id, filename, original_text, text_length)
+            VALUES (?, ?, ?, ?)
+            ''', (user_id, filename, _enc(text_content), len(text_content)))
+            note_id = cursor.lastrowid
         return note_id
     except Exception as e:
         print(f"Error saving note: {e}")
         return None
 
+@run_in_db_thread
 def get_note(note_id: int) -> Optional[Dict]:
     """Get a specific note"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM notes WHERE id = ?', (note_id,))
     note = cursor.fetchone()
-    conn.close()
-    return dict(note) if note else None
+    if not note:
+        return None
+    note = dict(note)
+    note['original_text'] = _dec(note['original_text'])
+    return note
 
+@run_in_db_thread
 def get_user_notes(user_id: str, limit: int = 10) -> List[Dict]:
     """Get all notes for a user"""
     conn = get_db_connection()
@@ -157,27 +291,27 @@ def get_user_notes(user_id: str, limit: int = 10) -> List[Dict]:
     LIMIT ?
     ''', (user_id, limit))
     notes = cursor.fetchall()
-    conn.close()
     return [dict(note) for note in notes]
 
 # Summary operations
+@run_in_db_thread
 def save_summary(note_id: int, user_id: str, summary_text: str, summary_type: str = "concise") -> Optional[int]:
     """Save generated summary"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-        INSERT INTO summaries (note_id, user_id, summary_text, summary_type)
-        VALUES (?, ?, ?, ?)
-        ''', (note_id, user_id, summary_text, summary_type))
-        summary_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            INSERT INTO summaries (note_id, user_id, summary_text, summary_type)
+            VALUES (?, ?, ?, ?)
+            ''', (note_id, user_id, _enc(summary_text), summary_type))
+            summary_id = cursor.lastrowid
         return summary_id
     except Exception as e:
         print(f"Error saving summary: {e}")
         return None
 
+@run_in_db_thread
 def get_note_summaries(note_id: int) -> List[Dict]:
     """Get all summaries for a note"""
     conn = get_db_connection()
@@ -188,41 +322,44 @@ def get_note_summaries(note_id: int) -> List[Dict]:
     ORDER BY created_at DESC
     ''', (note_id,))
     summaries = cursor.fetchall()
-    conn.close()
-    return [dict(summary) for summary in summaries]
+    return [
+        {**dict(summary), 'summary_text': _dec(summary['summary_text'])}
+        for summary in summaries
+    ]
 
 # Quiz operations
+@run_in_db_thread
 def save_quiz(note_id: int, user_id: str, questions: List[Dict], question_type: str = "mixed") -> Optional[int]:
     """Save generated quiz"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        questions_json = json.dumps(questions)
-        cursor.execute('''
-        INSERT INTO quizzes (note_id, user_id, questions, num_questions, question_type)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (note_id, user_id, questions_json, len(questions), question_type))
-        quiz_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with conn:
+            cursor = conn.cursor()
+            questions_json = orjson.dumps(questions).decode()
+            cursor.execute('''
+            INSERT INTO quizzes (note_id, user_id, questions, num_questions, question_type)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (note_id, user_id, questions_json, len(questions), question_type))
+            quiz_id = cursor.lastrowid
         return quiz_id
     except Exception as e:
         print(f"Error saving quiz: {e}")
         return None
 
+@run_in_db_thread
 def get_quiz(quiz_id: int) -> Optional[Dict]:
     """Get a specific quiz"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM quizzes WHERE id = ?', (quiz_id,))
     quiz = cursor.fetchone()
-    conn.close()
     if quiz:
         quiz_dict = dict(quiz)
-        quiz_dict['questions'] = json.loads(quiz_dict['questions'])
+        quiz_dict['questions'] = orjson.loads(quiz_dict['questions'])
         return quiz_dict
     return None
 
+@run_in_db_thread
 def get_user_quizzes(user_id: str, limit: int = 10) -> List[Dict]:
     """Get all quizzes for a user"""
     conn = get_db_connection()
@@ -236,72 +373,168 @@ def get_user_quizzes(user_id: str, limit: int = 10) -> List[Dict]:
     LIMIT ?
     ''', (user_id, limit))
     quizzes = cursor.fetchall()
-    conn.close()
     return [dict(quiz) for quiz in quizzes]
 
 # Quiz results operations
+def quiz_percentage(score: int, total_questions: int) -> float:
+    """Score as a percentage of the total"""
+    return (score / total_questions) * 100 if total_questions > 0 else 0
+
+@run_in_db_thread
 def save_quiz_result(quiz_id: int, user_id: str, score: int, total_questions: int) -> Optional[int]:
     """Save quiz attempt result"""
     try:
-        percentage = (score / total_questions) * 100 if total_questions > 0 else 0
+        percentage = quiz_percentage(score, total_questions)
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-        INSERT INTO quiz_results (quiz_id, user_id, score, total_questions, percentage)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (quiz_id, user_id, score, total_questions, percentage))
-        result_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            INSERT INTO quiz_results (quiz_id, user_id, score, total_questions, percentage)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (quiz_id, user_id, score, total_questions, percentage))
+            result_id = cursor.lastrowid
         return result_id
     except Exception as e:
         print(f"Error saving quiz result: {e}")
         return None
 
+@run_in_db_thread
+def save_quiz_results_bulk(results: List[Tuple[int, str, int, int]]) -> int:
+    """Save many (quiz_id, user_id, score, total_questions) results in one transaction"""
+    try:
+        rows = [
+            (quiz_id, user_id, score, total_questions, quiz_percentage(score, total_questions))
+            for quiz_id, user_id, score, total_questions in results
+        ]
+        conn = get_db_connection()
+        with conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+            INSERT INTO quiz_results (quiz_id, user_id, score, total_questions, percentage)
+            VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+        return len(rows)
+    except Exception as e:
+        print(f"Error saving quiz results: {e}")
+        return 0
+
+# Results queued by enqueue_quiz_result and written in batches by quiz_result_writer,
+# so a burst of submissions costs one commit instead of one per result
+QUIZ_RESULT_FLUSH_INTERVAL = 0.05  # seconds
+_quiz_result_queue: "asyncio.Queue[Tuple[int, str, int, int]]" = asyncio.Queue()
+
+def enqueue_quiz_result(quiz_id: int, user_id: str, score: int, total_questions: int) -> None:
+    """Queue a quiz result to be saved with the next batch"""
+    _quiz_result_queue.put_nowait((quiz_id, user_id, score, total_questions))
+
+async def flush_quiz_results() -> int:
+    """Write every queued quiz result now"""
+    results = []
+    while not _quiz_result_queue.empty():
+        results.append(_quiz_result_queue.get_nowait())
+    if not results:
+        return 0
+    return await save_quiz_results_bulk(results)
+
+async def quiz_result_writer(stop: asyncio.Event, interval: float = QUIZ_RESULT_FLUSH_INTERVAL) -> None:
+    """
+    Background task that flushes queued quiz results every `interval` seconds.
+    Once `stop` is set it writes whatever is still queued and returns; it is
+    stopped this way rather than cancelled so an in-flight batch isn't lost.
+    """
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        await flush_quiz_results()
+
+@run_in_db_thread
 def get_user_progress(user_id: str) -> Dict:
     """Get user's overall progress statistics"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Total notes
-    cursor.execute('SELECT COUNT(*) as count FROM notes WHERE user_id = ?', (user_id,))
-    total_notes = cursor.fetchone()['count']
+    # Single primary-key lookup on the trigger-maintained counters
+    cursor.execute('SELECT * FROM user_stats WHERE user_id = ?', (user_id,))
+    stats = cursor.fetchone()
     
-    # Total quizzes
-    cursor.execute('SELECT COUNT(*) as count FROM quizzes WHERE user_id = ?', (user_id,))
-    total_quizzes = cursor.fetchone()['count']
+    if not stats:
+        return {
+            "user_id": user_id,
+            "total_notes": 0,
+            "total_quizzes": 0,
+            "total_attempts": 0,
+            "average_score": 0,
+            "last_activity": None
+        }
     
-    # Average quiz score
-    cursor.execute('''
-    SELECT AVG(percentage) as avg_score, COUNT(*) as attempts
-    FROM quiz_results 
-    WHERE user_id = ?
-    ''', (user_id,))
-    result = cursor.fetchone()
-    avg_score = result['avg_score'] or 0
-    total_attempts = result['attempts']
-    
-    # Recent activity
-    cursor.execute('''
-    SELECT uploaded_at FROM notes 
-    WHERE user_id = ? 
-    ORDER BY uploaded_at DESC 
-    LIMIT 1
-    ''', (user_id,))
-    last_note = cursor.fetchone()
-    last_activity = last_note['uploaded_at'] if last_note else None
-    
-    conn.close()
+    attempts = stats['total_attempts']
+    avg_score = stats['score_sum'] / attempts if attempts else 0
     
     return {
         "user_id": user_id,
-        "total_notes": total_notes,
-        "total_quizzes": total_quizzes,
-        "total_attempts": total_attempts,
+        "total_notes": stats['total_notes'],
+        "total_quizzes": stats['total_quizzes'],
+        "total_attempts": attempts,
         "average_score": round(avg_score, 2),
-        "last_activity": last_activity
+        "last_activity": stats['last_activity']
     }
 
+# Response cache operations
+@run_in_db_thread
+def get_cached_response(key: str) -> Optional[Tuple[str, float]]:
+    """Get an unexpired cached AI response by key, with the seconds it has left to live"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT value, ? - (julianday('now') - julianday(created_at)) * 86400 AS ttl_left
+        FROM response_cache
+        WHERE key = ?
+        ''', (RESPONSE_CACHE_TTL, key))
+        row = cursor.fetchone()
+        if not row or row['ttl_left'] <= 0:
+            return None
+        return row['value'], row['ttl_left']
+    except Exception as e:
+        print(f"Error reading response cache: {e}")
+        return None
+
+@run_in_db_thread
+def save_cached_response(key: str, value: str) -> bool:
+    """Save an AI response to the cache"""
+    try:
+        conn = get_db_connection()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            INSERT OR REPLACE INTO response_cache (key, value, created_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ''', (key, value))
+        
+        global _response_cache_writes
+        _response_cache_writes += 1
+        if _response_cache_writes % RESPONSE_CACHE_PRUNE_EVERY == 0:
+            _prune_response_cache(conn)
+        return True
+    except Exception as e:
+        print(f"Error saving response cache: {e}")
+        return False
+
+def _prune_response_cache(conn: sqlite3.Connection) -> None:
+    """Delete expired cache entries, then the oldest ones beyond RESPONSE_CACHE_MAX_ROWS"""
+    with conn:
+        conn.execute(
+            "DELETE FROM response_cache WHERE created_at <= datetime('now', ?)",
+            (f'-{RESPONSE_CACHE_TTL} seconds',)
+        )
+        conn.execute('''
+        DELETE FROM response_cache WHERE key IN (
+            SELECT key FROM response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+        )
+        ''', (RESPONSE_CACHE_MAX_ROWS,))
+
 # Initialize database when module is imported
 if __name__ == "__main__":
     init_database()
\ No newline at end of file
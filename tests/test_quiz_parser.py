@@ -0,0 +1,42 @@
+from ai_services import parse_quiz_response, quiz_cache_check
+
+
+def test_true_false_question_containing_correct():
+    quiz_text = "Q: Is the following correct: the sun is cold\nCorrect: False"
+    assert parse_quiz_response(quiz_text, "true_false") == [{
+        "question": "Is the following correct: the sun is cold",
+        "options": None,
+        "correct_answer": "False",
+        "type": "true_false",
+    }]
+
+
+def test_mcq_question_containing_correct():
+    quiz_text = (
+        "Q: Which of the following statements is correct:\n"
+        "A) The sun is cold\n"
+        "B) Water boils at 100C at sea level\n"
+        "C) Fish can fly\n"
+        "D) The moon is made of cheese\n"
+        "correct: B"
+    )
+    questions = parse_quiz_response(quiz_text, "mcq")
+    assert len(questions) == 1
+    assert questions[0]["question"] == "Which of the following statements is correct:"
+    assert questions[0]["correct_answer"] == "Water boils at 100C at sea level"
+    assert questions[0]["type"] == "mcq"
+
+
+def test_mixed_quiz():
+    quiz_text = (
+        "Q: What is 2 + 2?\nA) 3\nB) 4\nC) 5\nD) 6\nCorrect: B\n"
+        "Q: The earth is round.\nCorrect: True"
+    )
+    questions = parse_quiz_response(quiz_text, "mixed")
+    assert [q["correct_answer"] for q in questions] == ["4", "True"]
+
+
+def test_quiz_cache_check_without_num_questions():
+    check = quiz_cache_check(None, "true_false")
+    assert check("Q: a?\nCorrect: True\nQ: b?\nCorrect: False\nQ: c?\nCorrect: True")
+    assert not check("Q: a?\nCorrect: True")
\ No newline at end of file
@@ -1,89 +1,351 @@
 import os
-import PyPDF2
-from docx import Document
+import io
 import re
-from typing import Optional
+import mmap
+import hashlib
+import tempfile
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, List, NamedTuple, Optional, Union, BinaryIO
 
+# A filesystem path or an open binary file (e.g. io.BytesIO of an upload)
+FileSource = Union[str, BinaryIO]
 
-def extract_text_from_file(file_path: str) -> str:
+# PDFs with at least this many pages are split across worker processes
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "50"))
+PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", str(os.cpu_count() or 1)))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+# On-disk cache of extracted text keyed by file contents; set EXTRACTION_CACHE_DIR="" to disable
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", os.path.join(tempfile.gettempdir(), "study_buddy_extractions"))
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", str(2 ** 30)))
+# Bump when extraction output changes so previously cached text is not served
+EXTRACTION_VERSION = 1
+
+_extraction_cache = None
+_extraction_cache_lock = threading.Lock()
+
+# count_words splits this many characters at a time to keep its word lists small
+_COUNT_WINDOW = 1 << 16
+
+# Compiled once at import; chunking runs on every upload
+_WORD_RE = re.compile(r'\S+')
+
+# Control characters dropped by clean_text. Whitespace controls (\x0b, \x0c, \x1c-\x1f, \x85)
+# are left for the whitespace collapse to turn into spaces.
+_CTRL_TRANS = dict.fromkeys(
+    code for code in [*range(0x00, 0x09), 0x0b, 0x0c, *range(0x0e, 0x20), *range(0x7f, 0xa0)]
+    if not chr(code).isspace()
+)
+# Same set as a regex: faster than translate once the text contains non-ASCII characters
+_CTRL_RE = re.compile('[%s]' % ''.join('\\x%02x' % code for code in _CTRL_TRANS))
+
+# Markup-compatibility fallback content in DOCX files, duplicating what mc:Choice holds
+_MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+
+def extract_text_from_file(source: FileSource, filename: Optional[str] = None,
+                           max_chars: Optional[int] = None) -> str:
     """
-    Extract text content from various file formats (txt, pdf, docx)
+    Extract text content from various file formats (txt, pdf, docx).
+    `source` may be a path or a binary file object; for file objects pass
+    `filename` so the format can be detected from its extension.
+    With `max_chars`, only the first max_chars characters are returned and
+    PDF/DOCX parsing stops as soon as enough text has been read.
     """
-    file_ext = os.path.splitext(file_path)[1].lower()
+    name = filename or source
+    file_ext = os.path.splitext(name)[1].lower()
     
     try:
-        if file_ext == '.txt':
-            return extract_text_from_txt(file_path)
-        elif file_ext == '.pdf':
-            return extract_text_from_pdf(file_path)
-        elif file_ext == '.docx':
-            return extract_text_from_docx(file_path)
-        else:
+        if file_ext not in ('.txt', '.pdf', '.docx'):
             raise ValueError(f"Unsupported file format: {file_ext}")
+        
+        # Previews skip the cache: hashing would read the whole file they are meant to avoid
+        cache = get_extraction_cache()
+        if cache is None or max_chars is not None:
+            return extract_text_by_type(source, file_ext, max_chars)
+        
+        # Other file objects are read into memory once so they can be both hashed and parsed
+        if not isinstance(source, (str, io.BytesIO)):
+            source = io.BytesIO(read_file_bytes(source))
+        key = f"{EXTRACTION_VERSION}:{file_ext}:{hash_file(source)}"
+        
+        text = cache.get(key)
+        if text is None:
+            text = extract_text_by_type(source, file_ext)
+            cache.set(key, text)
+        return text
     
     except Exception as e:
-        raise Exception(f"Failed to extract text from {file_path}: {str(e)}")
+        raise Exception(f"Failed to extract text from {name}: {str(e)}")
+
+def extract_text_by_type(source: FileSource, file_ext: str, max_chars: Optional[int] = None) -> str:
+    """Run the extractor for a file extension, bypassing the extraction cache"""
+    if file_ext == '.txt':
+        return extract_text_from_txt(source, max_chars)
+    elif file_ext == '.pdf':
+        return extract_text_from_pdf(source, max_chars)
+    elif file_ext == '.docx':
+        return extract_text_from_docx(source, max_chars)
+    else:
+        raise ValueError(f"Unsupported file format: {file_ext}")
 
-def extract_text_from_txt(file_path: str) -> str:
+def get_extraction_cache():
+    """The on-disk extraction cache, opened on first use; None when disabled"""
+    global _extraction_cache
+    if not EXTRACTION_CACHE_DIR:
+        return None
+    with _extraction_cache_lock:
+        if _extraction_cache is None:
+            import diskcache
+            
+            _extraction_cache = diskcache.Cache(EXTRACTION_CACHE_DIR, size_limit=EXTRACTION_CACHE_SIZE)
+        return _extraction_cache
+
+def hash_file(source: FileSource) -> str:
+    """Hash of a file's full contents; in-memory files are hashed without copying"""
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(source, io.BytesIO):
+        # getvalue shares the buffer; getbuffer would copy one made from bytes
+        digest.update(source.getvalue())
+    elif isinstance(source, str):
+        with open(source, 'rb') as file:
+            for block in iter(functools.partial(file.read, 1 << 20), b''):
+                digest.update(block)
+    else:
+        digest.update(read_file_bytes(source))
+    return digest.hexdigest()
+
+def extract_text_from_files(paths: List[str], max_chars: Optional[int] = None) -> List[str]:
+    """
+    Extract text from several files, in parallel across worker processes.
+    Results are returned in the same order as `paths`.
+    """
+    if len(paths) < 2 or PARSER_WORKERS < 2:
+        return [extract_text_from_file(path, max_chars=max_chars) for path in paths]
+    
+    # Workers open each file themselves, so only the path crosses the process boundary
+    chunksize = max(1, len(paths) // (PARSER_WORKERS * 4))
+    extract = functools.partial(extract_text_from_file, max_chars=max_chars)
+    return map_in_process_pool(extract, paths, chunksize=chunksize)
+
+def read_file_bytes(source: FileSource) -> bytes:
+    """Read the full contents of a path or binary file object"""
+    if isinstance(source, str):
+        with open(source, 'rb') as file:
+            return file.read()
+    if isinstance(source, io.BytesIO):
+        # The whole buffer, returned without copying
+        return source.getvalue()
+    return source.read()
+
+def extract_text_from_txt(source: FileSource, max_chars: Optional[int] = None) -> str:
     """Extract text from .txt files"""
-    encodings = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
+    if isinstance(source, str):
+        # Decode straight from a memory map of the file instead of reading it into a bytes copy
+        with open(source, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return ""
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return decode_text(data)[:max_chars]
+    
+    return decode_text(read_file_bytes(source))[:max_chars]
+
+def decode_text(data) -> str:
+    """Decode raw text file contents (bytes or any buffer) and clean the result"""
+    try:
+        return clean_text(str(data, 'utf-8'))
+    except UnicodeDecodeError:
+        pass
+    
+    import charset_normalizer
     
-    for encoding in encodings:
+    # Not UTF-8: detect the encoding once instead of trying codecs one after another
+    matches = charset_normalizer.from_bytes(bytes(data))
+    best_match = matches.best()
+    if best_match is not None:
+        # Similar code pages often score identically; on a tie prefer Western cp1252
+        for match in matches:
+            if 'cp1252' in match.could_be_from_charset and \
+                    (match.chaos, match.coherence) == (best_match.chaos, best_match.coherence):
+                best_match = match
+                break
+        return clean_text(str(best_match))
+    
+    # latin-1 maps every byte, so this always succeeds
+    return clean_text(str(data, 'latin-1'))
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Worker processes shared by CPU-heavy parsing, started on first use.
+    MuPDF holds the GIL and is not thread-safe, so parallel parsing needs processes.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # Don't fork a server process that already has threads running
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _process_pool = ProcessPoolExecutor(
+                max_workers=PARSER_WORKERS,
+                mp_context=multiprocessing.get_context(start_method),
+                initializer=_init_parser_worker
+            )
+        return _process_pool
+
+def map_in_process_pool(func, *iterables: list, chunksize: int = 1) -> list:
+    """
+    Map `func` over the shared process pool. If a worker died (e.g. MuPDF crashing
+    on a malformed PDF) the broken pool is replaced and the map retried once.
+    """
+    for attempt in range(2):
+        pool = get_process_pool()
         try:
-            with open(file_path, 'r', encoding=encoding) as file:
-                text = file.read()
-                return clean_text(text)
-        except UnicodeDecodeError:
-            continue
+            return list(pool.map(func, *iterables, chunksize=chunksize))
+        except BrokenProcessPool:
+            _reset_process_pool(pool)
+            if attempt:
+                raise
+
+def _reset_process_pool(broken_pool: ProcessPoolExecutor) -> None:
+    """Forget a broken pool so the next get_process_pool() starts a fresh one"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is broken_pool:
+            _process_pool = None
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+def _init_parser_worker():
+    """Worker processes parse serially; only the parent fans work out to the pool"""
+    global PARSER_WORKERS
+    PARSER_WORKERS = 1
+
+def _open_pdf(source: Union[str, bytes]):
+    """Open a PDF path or in-memory PDF with PyMuPDF"""
+    import pymupdf
     
-    raise Exception("Could not decode text file with any supported encoding")
+    if isinstance(source, str):
+        return pymupdf.open(source)
+    return pymupdf.open(stream=source, filetype="pdf")
 
-def extract_text_from_pdf(file_path: str) -> str:
+def _pdf_page_text(page) -> str:
+    """
+    Text of one PyMuPDF page. Pages that reference no fonts (scanned or
+    image-only pages) cannot contain text, so their content is never parsed.
+    """
+    if not page.get_fonts():
+        return ""
+    return page.get_text("text")
+
+def _take_text(pieces: Iterable[str], max_chars: Optional[int], separator: str = "") -> List[str]:
+    """
+    Consume raw text pieces in order. With max_chars, stop as soon as the
+    pieces taken so far clean up to at least max_chars characters.
+    """
+    if max_chars is None:
+        return list(pieces)
+    
+    # Always take some text so callers can still tell an empty document apart
+    needed = max(max_chars, 1)
+    taken = []
+    raw_length = 0
+    check_at = needed
+    for piece in pieces:
+        taken.append(piece)
+        raw_length += len(piece) + len(separator)
+        if raw_length >= check_at:
+            if len(clean_text(separator.join(taken))) >= needed:
+                break
+            # Mostly whitespace so far; check again once the raw text has doubled
+            check_at = raw_length * 2
+    return taken
+
+def _pdf_page_range_texts(source: Union[str, bytes], start: int, stop: int) -> List[str]:
+    """Text of pages [start, stop) of a PDF; runs inside worker processes"""
+    with _open_pdf(source) as doc:
+        return [_pdf_page_text(doc[page_num]) for page_num in range(start, stop)]
+
+def _pdf_page_texts_pymupdf(source: Union[str, bytes], max_chars: Optional[int] = None) -> List[str]:
+    """Text of each PDF page using PyMuPDF (MuPDF's C parser)"""
+    with _open_pdf(source) as doc:
+        page_count = doc.page_count
+        if max_chars is not None or page_count < PDF_PARALLEL_MIN_PAGES or PARSER_WORKERS < 2:
+            return _take_text((_pdf_page_text(page) for page in doc), max_chars, "\n")
+    
+    # Large PDF: each worker opens its own copy and extracts a contiguous range of pages
+    pages_per_worker = -(-page_count // PARSER_WORKERS)
+    starts = list(range(0, page_count, pages_per_worker))
+    stops = [min(start + pages_per_worker, page_count) for start in starts]
+    page_ranges = map_in_process_pool(_pdf_page_range_texts, [source] * len(starts), starts, stops)
+    return [page_text for page_range in page_ranges for page_text in page_range]
+
+def _pdf_page_texts_pypdf2(source: Union[str, bytes], max_chars: Optional[int] = None) -> List[str]:
+    """Text of each PDF page using PyPDF2 (pure Python, slower but more lenient)"""
+    import PyPDF2
+    
+    pdf_reader = PyPDF2.PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+    return _take_text((page.extract_text() or "" for page in pdf_reader.pages), max_chars, "\n")
+
+def extract_text_from_pdf(source: FileSource, max_chars: Optional[int] = None) -> str:
     """Extract text from PDF files"""
     try:
-        text = ""
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            num_pages = len(pdf_reader.pages)
-            
-            if num_pages == 0:
-                raise Exception("PDF has no pages")
-            
-            for page_num in range(num_pages):
-                page = pdf_reader.pages[page_num]
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        # Both parsers accept a path; file objects are read once and shared as bytes
+        if not isinstance(source, str):
+            source = read_file_bytes(source)
+        
+        try:
+            page_texts = _pdf_page_texts_pymupdf(source, max_chars)
+        except Exception:
+            # Fall back for PDFs that MuPDF rejects
+            page_texts = _pdf_page_texts_pypdf2(source, max_chars)
+        
+        if not page_texts:
+            raise Exception("PDF has no pages")
+        
+        text = "\n".join(page_text for page_text in page_texts if page_text)
         
         if not text.strip():
             raise Exception("No text could be extracted from PDF")
         
-        return clean_text(text)
+        return clean_text(text)[:max_chars]
     
     except Exception as e:
         raise Exception(f"PDF extraction failed: {str(e)}")
 
-def extract_text_from_docx(file_path: str) -> str:
+def extract_text_from_docx(source: FileSource, max_chars: Optional[int] = None) -> str:
     """Extract text from DOCX files"""
+    from docx import Document
+    from docx.oxml.ns import qn
+    
     try:
-        doc = Document(file_path)
-        text = ""
+        doc = Document(source)
+        
+        # Walk the body XML once, in document order, rather than building python-docx
+        # objects for every paragraph, table row and cell
+        body = doc.element.body
+        
+        # Word writes content such as text boxes twice, in mc:Choice and again in
+        # mc:Fallback; only read the first copy
+        fallback_elements = {element for fallback in body.iter(_MC_FALLBACK) for element in fallback.iter()}
         
-        # Extract text from paragraphs
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
+        # Tabs, line breaks and the start of each paragraph or cell separate words
+        text_tag = qn('w:t')
+        elements = (
+            element for element in body.iter(text_tag, qn('w:tab'), qn('w:br'), qn('w:p'), qn('w:tc'))
+            if element not in fallback_elements
+        )
+        pieces = ((element.text or "") if element.tag == text_tag else "\n" for element in elements)
         
-        # Extract text from tables
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    text += cell.text + " "
-                text += "\n"
+        text = "".join(_take_text(pieces, max_chars))
         
         if not text.strip():
             raise Exception("No text could be extracted from DOCX")
         
-        return clean_text(text)
+        return clean_text(text)[:max_chars]
     
     except Exception as e:
         raise Exception(f"DOCX extraction failed: {str(e)}")
@@ -92,46 +354,58 @@ def clean_text(text: str) -> str:
     """
     Clean and normalize extracted text
     """
-    # Remove excessive whitespace
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Remove excessive newlines
-    text = re.sub(r'\n\s*\n', '\n\n', text)
-    
-    # Remove special characters and control characters
-    text = re.sub(r'[\x00-\x08\x0b-\x0c\x0e-\x1f\x7f-\x9f]', '', text)
-    
-    # Strip leading/trailing whitespace
-    text = text.strip()
+    # Remove control characters in a single C-level pass. translate has a fast
+    # path for ASCII strings but does a dict lookup per character otherwise.
+    if text.isascii():
+        text = text.translate(_CTRL_TRANS)
+    else:
+        text = _CTRL_RE.sub('', text)
     
-    return text
+    # Collapse all whitespace (newlines included) to single spaces and trim.
+    # str.split/join does this in C without the regex engine's per-character overhead.
+    return ' '.join(text.split())
+
+class FileMeta(NamedTuple):
+    """One stat call and one path split, shared by the file validators"""
+    path: str
+    filename: str
+    extension: str
+    stat: os.stat_result
 
-def validate_file_size(file_path: str, max_size_mb: int = 10) -> bool:
+def get_file_meta(file_path: str) -> FileMeta:
+    """
+    Stat a file once. Pass the result to validate_file_size, validate_file_type
+    and get_file_info instead of a path so they don't stat and split it again.
+    """
+    filename = os.path.basename(file_path)
+    return FileMeta(file_path, filename, os.path.splitext(filename)[1].lower(), os.stat(file_path))
+
+def validate_file_size(file_path: Union[str, FileMeta], max_size_mb: int = 10) -> bool:
     """
     Validate file size is within limits
     """
     max_size_bytes = max_size_mb * 1024 * 1024
-    file_size = os.path.getsize(file_path)
+    file_size = file_path.stat.st_size if isinstance(file_path, FileMeta) else os.path.getsize(file_path)
     return file_size <= max_size_bytes
 
-def validate_file_type(file_path: str) -> bool:
+def validate_file_type(file_path: Union[str, FileMeta]) -> bool:
     """
     Validate file type is supported
     """
     allowed_extensions = ['.txt', '.pdf', '.docx']
-    file_ext = os.path.splitext(file_path)[1].lower()
+    file_ext = file_path.extension if isinstance(file_path, FileMeta) else os.path.splitext(file_path)[1].lower()
     return file_ext in allowed_extensions
 
-def get_file_info(file_path: str) -> dict:
+def get_file_info(file_path: Union[str, FileMeta]) -> dict:
     """
     Get file metadata
     """
-    file_stats = os.stat(file_path)
-    file_ext = os.path.splitext(file_path)[1].lower()
+    meta = file_path if isinstance(file_path, FileMeta) else get_file_meta(file_path)
+    file_stats = meta.stat
     
     return {
-        "filename": os.path.basename(file_path),
-        "extension": file_ext,
+        "filename": meta.filename,
+        "extension": meta.extension,
         "size_bytes": file_stats.st_size,
         "size_mb": round(file_stats.st_size / (1024 * 1024), 2),
         "created_at": file_stats.st_ctime,
@@ -145,11 +419,12 @@ def sanitize_filename(filename: str) -> str:
     # Remove path components
     filename = os.path.basename(filename)
     
-    # Remove special characters except dots, hyphens, and underscores
-    filename = re.sub(r'[^\w\s.-]', '', filename)
-    
-    # Replace spaces with underscores
-    filename = filename.replace(' ', '_')
+    # Remove special characters except dots, hyphens, and underscores,
+    # and replace spaces with underscores, in one pass
+    filename = ''.join(
+        '_' if c == ' ' else c if (c.isalnum() or c.isspace() or c in '_.-') else ''
+        for c in filename
+    )
     
     # Limit length
     name, ext = os.path.splitext(filename)
@@ -160,43 +435,107 @@ def sanitize_filename(filename: str) -> str:
 
 def chunk_text_for_processing(text: str, chunk_size: int = 1000, overlap: int = 100) -> list:
     """
-    Split text into overlapping chunks for better context preservation
+    Split text into overlapping chunks for better context preservation.
+    Chunks are sliced from the original text at word offsets found by the
+    regex engine, so no per-word strings are created or joined back.
+    A negative overlap leaves that many words out between chunks.
     """
-    words = text.split()
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError("overlap must be smaller than chunk_size")
+    
+    skip_step, finish_chunk = _chunk_patterns(step, overlap)
     chunks = []
+    end = len(text)
+    first_word = _WORD_RE.search(text)
+    start = first_word.start() if first_word else end
     
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i + chunk_size])
-        chunks.append(chunk)
+    while start < end:
+        # Jump over the words that belong only to this chunk
+        skipped = skip_step.match(text, start)
+        if overlap < 0:
+            # Chunks are spaced apart: keep this chunk's words and drop the gap after them
+            chunks.append(text[start:finish_chunk.match(text, start).end()])
+            if skipped is None or skipped.end() == end:
+                break
+            start = skipped.end()
+            continue
+        
+        if skipped is None or skipped.end() == end:
+            chunks.append(text[start:].rstrip())
+            break
+        
+        # The next chunk starts here; extend this one over the overlapping words
+        next_start = skipped.end()
+        if finish_chunk is None:
+            chunks.append(text[start:next_start].rstrip())
+        else:
+            chunks.append(text[start:finish_chunk.match(text, next_start).end()])
+        start = next_start
     
     return chunks
 
+@functools.lru_cache(maxsize=32)
+def _chunk_patterns(step: int, overlap: int):
+    """
+    Compiled patterns matching `step` words and then up to `overlap` more
+    (with a negative overlap, up to the step + overlap words of a whole chunk)
+    """
+    skip_step = re.compile(r'(?:\S+\s+){%d}' % step)
+    extra_words = overlap if overlap >= 0 else step + overlap
+    finish_chunk = re.compile(r'(?:\S+\s+){0,%d}\S+' % (extra_words - 1)) if extra_words else None
+    return skip_step, finish_chunk
+
 def count_words(text: str) -> int:
-    """Count words in text"""
-    return len(text.split())
+    """
+    Count words in text.
+    Splits one window at a time so only a small word list is ever alive.
+    """
+    count = 0
+    for start in range(0, len(text), _COUNT_WINDOW):
+        window = text[start:start + _COUNT_WINDOW]
+        count += len(window.split())
+        # A word straddling the window edge was counted in both windows
+        if start and not window[0].isspace() and not text[start - 1].isspace():
+            count -= 1
+    return count
 
-def estimate_reading_time(text: str, words_per_minute: int = 200) -> int:
+def estimate_reading_time(text: str, words_per_minute: int = 200, word_count: Optional[int] = None) -> int:
     """
-    Estimate reading time in minutes
+    Estimate reading time in minutes.
+    Pass `word_count` if it is already known to avoid counting again.
     """
-    word_count = count_words(text)
+    if word_count is None:
+        word_count = count_words(text)
     return max(1, round(word_count / words_per_minute))
 
 def preview_text(text: str, max_length: int = 200) -> str:
     """
-    Get a preview of the text (first N characters)
+    Get a preview of the text (first N characters).
+    To preview a file without extracting all of it, pass max_chars to extract_text_from_file.
     """
     if len(text) <= max_length:
         return text
     
     return text[:max_length] + "..."
 
-def validate_text_content(text: str, min_words: int = 10) -> bool:
+def validate_text_content(text: str, min_words: int = 10, word_count: Optional[int] = None) -> bool:
     """
-    Validate that text has minimum content for processing
+    Validate that text has minimum content for processing.
+    Pass `word_count` if it is already known to avoid counting again.
     """
-    word_count = count_words(text)
-    return word_count >= min_words and len(text.strip()) > 0
+    if word_count is not None:
+        return word_count >= min_words and bool(text) and not text.isspace()
+    
+    # Stop scanning as soon as enough words have been seen
+    words_seen = 0
+    for _ in _WORD_RE.finditer(text):
+        words_seen += 1
+        if words_seen >= min_words:
+            return True
+    return False
 
 def format_error_message(error: Exception, context: str = "") -> str:
     """